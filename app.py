@@ -4,26 +4,77 @@ Neuro Notes - BrainBit EEG Data Recorder
 Main Flask application with WebSocket support for real-time data streaming
 """
 
+# Must run before any other import so sockets, threads and sleeps cooperate
+# with the eventlet hub
+import eventlet
+eventlet.monkey_patch()
+
 import os
 import json
+import logging
 import socket
 import time
-import threading
+from collections import deque
 from datetime import datetime
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, jsonify, request
+from flask.helpers import get_debug_flag
+from flask.json.provider import DefaultJSONProvider
 from flask_socketio import SocketIO, emit
 from dotenv import load_dotenv
 from pythonosc import udp_client
+import numpy as np
 
 from device_manager import BrainBitManager
 from data_storage import DataStorage
 
+log = logging.getLogger(__name__)
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+class ORJSONSocketIO:
+    """json module stand-in for Socket.IO packet encoding"""
+    
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
+
+
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
-socketio = SocketIO(app, cors_allowed_origins="*")
+
+socketio_options = {'cors_allowed_origins': "*", 'async_mode': 'eventlet'}
+if ORJSON_AVAILABLE:
+    app.json = ORJSONProvider(app)
+    socketio_options['json'] = ORJSONSocketIO
+socketio = SocketIO(app, **socketio_options)
 
 # OSC client for Max
 UDP_IP = "127.0.0.1"   # Max is running on same machine
@@ -37,7 +88,19 @@ data_storage = DataStorage()
 
 # Global state
 recording_session = None
-is_recording = False
+
+# Live sample batches waiting to be pushed to the web interface. Bounded so a
+# slow client drops the oldest batches instead of stalling the device callback.
+LIVE_QUEUE_SIZE = 512
+LIVE_EMIT_INTERVAL = 0.033  # seconds, ~30 Hz
+live_queue = deque(maxlen=LIVE_QUEUE_SIZE)
+live_pump_started = False
+latest_status = None  # Device status waiting to go out with the next batch
+
+# Recording problems reported by storage on the acquisition thread, emitted
+# by the live data pump. The session stays open until stop_recording saves it.
+recording_errors = deque()
+data_storage.error_callback = recording_errors.append
 
 
 @app.route('/')
@@ -52,18 +115,24 @@ def get_status():
     return jsonify({
         'device_connected': device_manager.is_connected(),
         'device_info': device_manager.get_device_info(),
-        'is_recording': is_recording,
+        'is_recording': data_storage.recording,
         'session_info': recording_session
     })
 
 
+@app.route('/api/scan_status')
+def get_scan_status():
+    """Get the state of the most recent device scan"""
+    return jsonify(device_manager.scan_status())
+
+
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
     print('Client connected')
     emit('status_update', {
         'device_connected': device_manager.is_connected(),
-        'is_recording': is_recording
+        'is_recording': data_storage.recording
     })
 
 
@@ -75,41 +144,64 @@ def handle_disconnect():
 
 @socketio.on('scan_devices')
 def handle_scan_devices():
-    """Scan for available BrainBit devices"""
+    """Scan for available BrainBit devices; results are pushed when the scan ends"""
+    sid = request.sid
+    
+    def scan_done(scan):
+        try:
+            socketio.emit('devices_found', {'devices': scan.result()}, to=sid)
+        except Exception as e:
+            socketio.emit('error', {'message': f'Device scan failed: {str(e)}'}, to=sid)
+    
     try:
-        devices = device_manager.scan_devices()
-        emit('devices_found', {'devices': devices})
+        device_manager.scan_devices_async().add_done_callback(scan_done)
     except Exception as e:
         emit('error', {'message': f'Device scan failed: {str(e)}'})
 
 
 @socketio.on('connect_device')
 def handle_connect_device(data):
-    """Connect to a specific BrainBit device"""
+    """Connect to a specific BrainBit device; the result is pushed when done"""
+    sid = request.sid
+    
+    def connect_done(connect):
+        try:
+            if connect.result():
+                # Start pushing live data and monitoring device status
+                start_live_data_pump()
+                start_device_monitoring()
+                socketio.emit('device_connected',
+                              {'device_info': device_manager.get_device_info()}, to=sid)
+            else:
+                socketio.emit('error', {'message': 'Failed to connect to device'}, to=sid)
+        except Exception as e:
+            socketio.emit('error', {'message': f'Connection failed: {str(e)}'}, to=sid)
+    
     try:
         device_id = data.get('device_id')
         
         # Set up live data callback for continuous monitoring
         device_manager._data_callback = handle_live_data_chunk
         
-        success = device_manager.connect_device(device_id)
-        
-        if success:
-            # Start monitoring device status
-            start_device_monitoring()
-            emit('device_connected', {'device_info': device_manager.get_device_info()})
-        else:
-            emit('error', {'message': 'Failed to connect to device'})
+        device_manager.connect_device_async(device_id).add_done_callback(connect_done)
     except Exception as e:
         emit('error', {'message': f'Connection failed: {str(e)}'})
 
 
 @socketio.on('disconnect_device')
 def handle_disconnect_device():
-    """Disconnect from current device"""
+    """Disconnect from current device; the result is pushed when done"""
+    sid = request.sid
+    
+    def disconnect_done(disconnect):
+        try:
+            disconnect.result()
+            socketio.emit('device_disconnected', to=sid)
+        except Exception as e:
+            socketio.emit('error', {'message': f'Disconnection failed: {str(e)}'}, to=sid)
+    
     try:
-        device_manager.disconnect()
-        emit('device_disconnected')
+        device_manager.disconnect_async().add_done_callback(disconnect_done)
     except Exception as e:
         emit('error', {'message': f'Disconnection failed: {str(e)}'})
 
@@ -117,7 +209,7 @@ def handle_disconnect_device():
 @socketio.on('start_recording')
 def handle_start_recording():
     """Start recording EEG data"""
-    global is_recording, recording_session
+    global recording_session
     
     try:
         if not device_manager.is_connected():
@@ -134,10 +226,10 @@ def handle_start_recording():
         # Start data storage
         data_storage.start_session(recording_session)
         
-        # Start recording from device (this sets up storage callback)
-        device_manager.start_recording(data_callback=handle_storage_data_chunk)
+        # Start recording from device; samples go straight into storage
+        device_manager.start_recording(data_callback=data_storage.add_data_chunk,
+                                       error_callback=data_storage.flag_session)
         
-        is_recording = True
         emit('recording_started', {'session_info': recording_session})
         
     except Exception as e:
@@ -147,10 +239,10 @@ def handle_start_recording():
 @socketio.on('stop_recording')
 def handle_stop_recording():
     """Stop recording EEG data"""
-    global is_recording, recording_session
+    global recording_session
     
     try:
-        if not is_recording:
+        if not data_storage.recording:
             emit('error', {'message': 'Not currently recording'})
             return
         
@@ -160,8 +252,6 @@ def handle_stop_recording():
         # Finalize data storage
         session_file = data_storage.stop_session()
         
-        is_recording = False
-        
         emit('recording_stopped', {
             'session_file': session_file,
             'session_info': recording_session
@@ -175,46 +265,89 @@ def handle_stop_recording():
 
 def handle_live_data_chunk(data_chunk):
     """Handle live data for visualization (always active when connected)"""
-    # Send real-time data to web interface for live visualization
-    simplified_data = {
-        'timestamp': data_chunk.get('timestamp'),
-        'eeg_data': data_chunk.get('eeg_data', {}),  # Now expects dict with O1,O2,T3,T4
-        'signal_strength': data_chunk.get('signal_strength', 0),
-        'battery_level': data_chunk.get('battery_level', 0),
-        'signal_quality': data_chunk.get('signal_quality', 'unknown'),
-        'packet_number': data_chunk.get('packet_number'),
-        'marker': data_chunk.get('marker')
-    }
-    
-    socketio.emit('live_data', simplified_data)
-
-    # Send data to Max in OSC format
-    eeg_data = simplified_data.get('eeg_data', {})
-    osc_client.send_message("/O1", eeg_data.get('O1'))
-    osc_client.send_message("/O2", eeg_data.get('O2'))
-    osc_client.send_message("/T3", eeg_data.get('T3'))
-    osc_client.send_message("/T4", eeg_data.get('T4'))
-
-def handle_storage_data_chunk(data_chunk):
-    """Handle data for storage (only when recording)"""
-    if is_recording:
-        # Store data locally
-        data_storage.add_data_chunk(data_chunk)
+    # Send real-time data to web interface for live visualization.
+    # Queued for the live data pump instead of emitting from the device thread.
+    # Max gets its OSC messages from the pump as well.
+    live_queue.append(data_chunk)
+
+
+def send_osc(data_chunk):
+    """Send the latest sample of a batch to Max in OSC format"""
+    o1, o2, t3, t4 = data_chunk.channels[-1].tolist()
+    osc_client.send_message("/O1", o1)
+    osc_client.send_message("/O2", o2)
+    osc_client.send_message("/T3", t3)
+    osc_client.send_message("/T4", t4)
+
+
+def start_live_data_pump():
+    """Start the background task that emits queued live data in batches"""
+    global live_pump_started
+    
+    if live_pump_started:
+        return
+    live_pump_started = True
+    
+    def pump():
+        while True:
+            socketio.sleep(LIVE_EMIT_INTERVAL)
+            try:
+                pump_tick()
+            except Exception:
+                # A bad batch or emit must not end live data for the process
+                log.exception("Live data pump error")
+    
+    def pump_tick():
+        global latest_status
+        while recording_errors:
+            socketio.emit('recording_error', {'message': recording_errors.popleft()})
+        status, latest_status = latest_status, None
+        if not live_queue and status is None:
+            return
+        
+        # One message per tick carrying all samples plus any status update
+        batches = [live_queue.popleft() for _ in range(len(live_queue))]
+        for batch in batches:
+            send_osc(batch)  # One OSC set per device batch
+        payload = {'count': 0, 'status': status}
+        if batches:
+            latest = batches[-1]
+            channels = np.concatenate([batch.channels for batch in batches])
+            payload.update({
+                'count': len(channels),
+                't0_ns': batches[0].t0_ns,
+                'dt_ns': latest.dt_ns,
+                'signal_quality': latest.signal_quality,
+                # Row-major O1, O2, T3, T4 per sample
+                'channels': (channels.astype('<f4', copy=False).tobytes()
+                             if MSGPACK_AVAILABLE else channels.ravel().tolist())
+            })
+        if MSGPACK_AVAILABLE:
+            # Binary frame, decoded with msgpack-lite in the web client
+            payload = msgpack.packb(payload, use_bin_type=True)
+        socketio.emit('live_data', payload)
+    
+    socketio.start_background_task(pump)
 
 
 def start_device_monitoring():
-    """Start monitoring device status in background thread"""
+    """Start monitoring device status in a background task"""
     def monitor():
+        global latest_status
         while device_manager.is_connected():
-            status = device_manager.get_device_status()
-            socketio.emit('device_status', status)
-            time.sleep(1)  # Update every second
+            # Sent with the next live data batch; battery only travels with status
+            latest_status = device_manager.get_device_status()
+            data_storage.battery_level = latest_status.get('battery_level', 0)
+            socketio.sleep(1)  # Update every second
     
-    thread = threading.Thread(target=monitor, daemon=True)
-    thread.start()
+    socketio.start_background_task(monitor)
 
 
 if __name__ == '__main__':
+    # Device and storage warnings (e.g. dropped samples) go to stderr
+    logging.basicConfig(level=logging.WARNING)
     print("Starting Neuro Notes application...")
     print("Open http://localhost:5000 in your browser")
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
+    # Served by eventlet's WSGI server; FLASK_DEBUG=1 (parsed as Flask does) enables debug mode.
+    # For deployment run under gunicorn instead: gunicorn -k eventlet -w 1 app:app
+    socketio.run(app, debug=get_debug_flag(), host='0.0.0.0', port=5000)
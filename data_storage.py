@@ -1,25 +1,175 @@
 """
 Data Storage Manager
-Handles local storage of EEG data with chunking and JSON format
+Handles local storage of EEG data with chunking: memory-mapped binary
+chunk files plus a JSON session manifest
 """
 
 import os
+import glob
 import json
 import time
 from datetime import datetime
+from functools import partial
 from typing import Dict, List, Optional
 
+import numpy as np
+
+# Samples arrive on SDK callback threads; chunk I/O must run on a real OS thread
+from native_threads import threading, queue, blocking
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """Pass-through stand-in for numba.njit"""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+if ORJSON_AVAILABLE:
+    _ORJSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC
+
+    def _dumps(obj) -> bytes:
+        """Serialize obj to indented JSON bytes"""
+        return orjson.dumps(obj, default=_json_default, option=_ORJSON_OPTIONS)
+
+    _loads = orjson.loads
+else:
+    def _dumps(obj) -> bytes:
+        """Serialize obj to indented JSON bytes (stdlib fallback)"""
+        return json.dumps(obj, indent=2, default=_json_default).encode('utf-8')
+
+    _loads = json.loads
+
+
+# BrainBit channel layout, in buffer row order
+CHANNELS = ('O1', 'O2', 'T3', 'T4')
+
+# Signal quality labels, indexed by the code stored in the buffer
+SIGNAL_QUALITY_LEVELS = ('unknown', 'poor', 'fair', 'good')
+_SIGNAL_QUALITY_CODES = {label: code for code, label in enumerate(SIGNAL_QUALITY_LEVELS)}
+
+# One sample per row in chunk files. Aligned so rows can be written in place
+# through a memory map (and by the numba-compiled writer). Chunk files have no
+# header; each session manifest records the layout its chunks were written with.
+ROW_DTYPE = np.dtype([
+    ('ts', 'i8'),  # ns since epoch
+    ('O1', 'f4'), ('O2', 'f4'), ('T3', 'f4'), ('T4', 'f4'),
+    ('pkt', 'u4'), ('bat', 'u1'), ('sq', 'u1')
+], align=True)
+
+
+def _json_default(obj):
+    """Fallback encoder for values the JSON encoder can't handle natively"""
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    return str(obj)
+
+
+@njit(cache=True)
+def _ingest(rows, w, t0_ns, dt_ns, channels, start, count, pkt, bat, sq):
+    """
+    Write count samples of a batch, from sample index start, into the
+    chunk rows from w and return the next write index
+    
+    channels is an (N, 4) array with columns in CHANNELS order; sample
+    timestamps are reconstructed from the batch start time and period.
+    """
+    for i in range(count):
+        row = rows[w + i]
+        j = start + i
+        row['ts'] = t0_ns + j * dt_ns
+        row['O1'] = channels[j, 0]
+        row['O2'] = channels[j, 1]
+        row['T3'] = channels[j, 2]
+        row['T4'] = channels[j, 3]
+        row['pkt'] = pkt
+        row['bat'] = bat
+        row['sq'] = sq
+    return w + count
+
+
+def _write_csv_rows(csvfile, rows: np.ndarray, levels):
+    """Write one chunk of ROW_DTYPE samples as CSV without a per-sample Python loop"""
+    timestamps = np.datetime_as_string(rows['ts'].astype('datetime64[ns]'), unit='us')
+    levels = np.asarray(levels)
+    table = np.rec.fromarrays(
+        [timestamps]
+        + [rows[name] for name in CHANNELS]
+        + [rows['bat'], levels[rows['sq']]]
+    )
+    np.savetxt(csvfile, table, fmt='%s', delimiter=',', newline='\r\n')
+
+
+class _ChunkFile:
+    """Chunk file memory-mapped at full capacity; samples are written in place"""
+    
+    def __init__(self, data_dir: str, session_id: str, chunk_id: int, capacity: int):
+        self.chunk_id = chunk_id
+        self.filename = f"{session_id}_chunk_{chunk_id:03d}.bin"
+        self.path = os.path.join(data_dir, self.filename)
+        self._mm = np.memmap(self.path, dtype=ROW_DTYPE, mode='w+', shape=(capacity,))
+        self.rows = self._mm.view(np.ndarray)
+    
+    def close(self, count: int) -> int:
+        """Flush written rows to disk, trim the file to count samples and return its size"""
+        size = count * ROW_DTYPE.itemsize
+        self._mm.flush()
+        self._mm = self.rows = None  # Unmap before resizing
+        os.truncate(self.path, size)
+        return size
+    
+    def discard(self):
+        """Unmap and delete an unused chunk file"""
+        self._mm = self.rows = None
+        os.remove(self.path)
+
 
 class DataStorage:
     """Manages local storage of EEG recording data"""
     
+    SPARE_TIMEOUT = 5.0  # seconds to wait for the writer to prepare the next chunk file
+    
     def __init__(self, data_dir: str = "data"):
         self.data_dir = data_dir
         self.current_session = None
         self.current_chunk = None
+        self.recording = False  # True between start_session and stop_session
+        self.error_callback = None  # Called with a message when a session problem is recorded
+        self._accepting = False  # Samples are written; cleared if storage cuts a recording short
+        self.battery_level = 0  # Latest device reading, stored with each sample
         self.chunk_size_minutes = 5  # Create new chunk every 5 minutes
+        self.sample_rate = 250  # Hz, used to size the sample buffer
         self.chunk_start_time = None
-        self.data_buffer = []
+        self._chunk_deadline_ns = 0  # time.monotonic_ns() at which the chunk rolls over
+        self._session_start_ns = None
+        
+        self._chunk_count = 0
+        
+        # Two mapped chunk files: one fills while the writer thread closes the
+        # previous one and prepares the next
+        self.chunk_capacity = self.chunk_size_minutes * 60 * self.sample_rate
+        self._active = None  # _ChunkFile receiving samples
+        self._spare = None  # Next _ChunkFile, prepared by the writer thread
+        self._spare_ready = threading.Event()
+        self._swap_lock = threading.Lock()
+        self._rows = None  # Row array of the active chunk file
+        self._w = 0  # Write index into the active chunk
+        
+        # Chunk file I/O runs off the acquisition path
+        self._writer_queue = queue.Queue()
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
         
         # Create data directory if it doesn't exist
         os.makedirs(self.data_dir, exist_ok=True)
@@ -32,34 +182,92 @@ class DataStorage:
             session_info: Dictionary with session metadata
         """
         self.current_session = session_info.copy()
+        self.current_session['signal_quality_levels'] = SIGNAL_QUALITY_LEVELS
+        self.current_session['row_dtype'] = np.lib.format.dtype_to_descr(ROW_DTYPE)
         self.current_session['chunks'] = []
         self.chunk_start_time = datetime.utcnow()
-        self.data_buffer = []
+        self._chunk_deadline_ns = time.monotonic_ns() + self.chunk_size_minutes * 60_000_000_000
+        self._session_start_ns = time.time_ns()
+        self._chunk_count = 0
+        self._active = self._new_chunk_file()
+        self._rows = self._active.rows
+        self._w = 0
+        self._spare_ready.clear()
+        self._writer_queue.put(self._prepare_spare)
+        self.recording = self._accepting = True
         
         print(f"Started new recording session: {session_info['session_id']}")
     
-    def add_data_chunk(self, data_chunk: Dict):
+    def add_data_chunk(self, data_chunk):
         """
-        Add a data chunk to the current recording
+        Add a batch of samples to the current recording. Registered directly
+        as the device recording callback; ignored while not recording, or
+        once storage has cut the recording short.
         
         Args:
-            data_chunk: Dictionary with EEG data and metadata
+            data_chunk: EEGChunk with t0_ns, dt_ns, an (N, 4) float32
+                channels array in CHANNELS order, and metadata. Battery
+                level comes from device status instead (see battery_level).
         """
-        if not self.current_session:
-            print("No active session. Call start_session first.")
+        if not self._accepting:
             return
         
-        # Add timestamp if not present
-        if 'timestamp' not in data_chunk:
-            data_chunk['timestamp'] = datetime.utcnow().isoformat()
+        channels = data_chunk.channels
+        t0_ns = data_chunk.t0_ns
+        dt_ns = data_chunk.dt_ns
+        pkt = data_chunk.packet_number
+        bat = self.battery_level
+        sq = _SIGNAL_QUALITY_CODES.get(data_chunk.signal_quality, 0)
         
-        # Add to buffer
-        self.data_buffer.append(data_chunk)
+        # Integer ns timestamps; ISO strings are only built at export time.
+        # A batch that fills the chunk file continues in the next one.
+        start, n = 0, len(channels)
+        session = self.current_session
+        self._swap_lock.acquire()
+        try:
+            # stop_session may have closed the chunk since the check above
+            if not self._accepting:
+                return
+            
+            while start < n:
+                count = min(n - start, self.chunk_capacity - self._w)
+                self._w = _ingest(self._rows, self._w, t0_ns, dt_ns, channels,
+                                  start, count, pkt, bat, sq)
+                start += count
+                
+                # Check if we need to create a new chunk file
+                if self._should_create_new_chunk():
+                    if not self._spare_ready.is_set():
+                        # Wait for the writer without the lock, so a stop
+                        # isn't held up; it saves the full chunk itself
+                        self._swap_lock.release()
+                        try:
+                            self._spare_ready.wait(self.SPARE_TIMEOUT)
+                        finally:
+                            self._swap_lock.acquire()
+                        if not self._accepting or self.current_session is not session:
+                            return
+                    self._save_current_chunk()
+                    if not self._accepting:
+                        break  # No next chunk file; see _save_current_chunk
+                    self._start_new_chunk()
+        finally:
+            self._swap_lock.release()
+    
+    def flag_session(self, message: str):
+        """
+        Record a problem with the current recording in its session metadata.
+        Registered as the device recording error callback.
         
-        # Check if we need to create a new chunk file
-        if self._should_create_new_chunk():
-            self._save_current_chunk()
-            self._start_new_chunk()
+        Args:
+            message: Description saved as the session's 'error'
+        """
+        # Called from the device thread. Under the lock, a session that is
+        # still recording hasn't been handed to _save_session_file yet.
+        with self._swap_lock:
+            if not self.recording:
+                return
+            self._report_error(message)
     
     def stop_session(self) -> Optional[str]:
         """
@@ -72,9 +280,24 @@ class DataStorage:
             print("No active session to stop")
             return None
         
-        # Save any remaining data in buffer
-        if self.data_buffer:
-            self._save_current_chunk()
+        # Stop accepting samples and save any remaining data in buffer. The
+        # lock waits out an ingest still running on the acquisition thread.
+        blocking(self._swap_lock.acquire)
+        try:
+            self.recording = self._accepting = False
+            if self._w:
+                self._save_current_chunk(final=True)
+        finally:
+            self._swap_lock.release()
+        
+        # Wait for pending writes
+        blocking(self._writer_queue.join)
+        
+        # Remove chunk files that were prepared but never filled
+        for chunk_file in (self._active, self._spare):
+            if chunk_file:
+                chunk_file.discard()
+        self._active = self._spare = self._rows = None
         
         # Create final session file
         session_file = self._save_session_file()
@@ -84,20 +307,14 @@ class DataStorage:
         # Reset state
         self.current_session = None
         self.current_chunk = None
-        self.data_buffer = []
+        self._w = 0
         
         return session_file
     
     def get_session_files(self) -> List[str]:
         """Get list of all saved session files"""
-        session_files = []
-        
-        if os.path.exists(self.data_dir):
-            for filename in os.listdir(self.data_dir):
-                if filename.endswith('_session.json'):
-                    session_files.append(os.path.join(self.data_dir, filename))
-        
-        return sorted(session_files)
+        pattern = os.path.join(glob.escape(self.data_dir), '*_session.json')
+        return sorted(glob.glob(pattern))
     
     def load_session(self, session_file: str) -> Optional[Dict]:
         """
@@ -110,74 +327,116 @@ class DataStorage:
             Session data dictionary or None if error
         """
         try:
-            with open(session_file, 'r') as f:
-                return json.load(f)
+            with open(session_file, 'rb') as f:
+                return _loads(f.read())
         except Exception as e:
             print(f"Error loading session file {session_file}: {e}")
             return None
     
     def _should_create_new_chunk(self) -> bool:
-        """Check if we should create a new chunk file"""
-        if not self.chunk_start_time:
-            return False
-        
-        # Check time-based chunking
-        time_diff = datetime.utcnow() - self.chunk_start_time
-        time_threshold = time_diff.total_seconds() > (self.chunk_size_minutes * 60)
-        
-        # Check size-based chunking (optional)
-        size_threshold = len(self.data_buffer) > 1000  # Adjust as needed
-        
-        return time_threshold or size_threshold
+        """Check if we should create a new chunk file (deadline passed or chunk file full)"""
+        return time.monotonic_ns() >= self._chunk_deadline_ns or self._w >= self.chunk_capacity
     
     def _start_new_chunk(self):
         """Start a new data chunk"""
         self.chunk_start_time = datetime.utcnow()
-        self.data_buffer = []
+        self._chunk_deadline_ns = time.monotonic_ns() + self.chunk_size_minutes * 60_000_000_000
+        self._w = 0
     
-    def _save_current_chunk(self):
-        """Save current data buffer as a chunk file"""
-        if not self.data_buffer:
-            return
+    def _save_current_chunk(self, final: bool = False):
+        """
+        Hand the active chunk file to the writer thread to be closed.
+        Called with _swap_lock held.
         
-        chunk_id = len(self.current_session['chunks']) + 1
-        chunk_filename = f"{self.current_session['session_id']}_chunk_{chunk_id:03d}.json"
-        chunk_path = os.path.join(self.data_dir, chunk_filename)
+        Args:
+            final: True at the end of the session, when no further chunk is needed
+        """
+        w = self._w
+        if not w:
+            return
         
-        # Prepare chunk data
-        chunk_data = {
-            'chunk_info': {
-                'chunk_id': chunk_id,
-                'session_id': self.current_session['session_id'],
-                'start_time': self.chunk_start_time.isoformat(),
-                'end_time': datetime.utcnow().isoformat(),
-                'sample_count': len(self.data_buffer)
-            },
-            'data': self.data_buffer.copy()
+        full = self._active
+        chunk_info = {
+            'chunk_id': full.chunk_id,
+            'filename': full.filename,
+            'start_time': self.chunk_start_time.isoformat(),
+            'end_time': datetime.utcnow().isoformat(),
+            'sample_count': w
         }
         
-        # Save chunk file
+        # Swap to the spare file. add_data_chunk already waited SPARE_TIMEOUT
+        # for it outside the lock, so it is only missing if the writer is stuck.
+        if not final and not self._spare_ready.is_set():
+            # The writer failed or stalled preparing it. Stop taking samples
+            # instead of blocking the acquisition thread and flag the session;
+            # it stays open until stop_session saves it.
+            self._accepting = False
+            self._report_error(f"Next chunk file was not ready after {self.SPARE_TIMEOUT}s; "
+                               "recording stopped early")
+            final = True
+        
+        if final:
+            self._active = self._rows = None
+        else:
+            self._active, self._spare = self._spare, None
+            self._rows = self._active.rows
+            self._spare_ready.clear()
+        self._w = 0
+        
+        self._writer_queue.put(partial(self._close_chunk, full, chunk_info, self.current_session['chunks']))
+        if not final:
+            self._writer_queue.put(self._prepare_spare)
+    
+    def _report_error(self, message: str):
+        """
+        Save the first problem with the current session and pass every one
+        on to error_callback. Called with _swap_lock held, from the
+        acquisition thread, so the callback must not block.
+        """
+        self.current_session.setdefault('error', message)
+        print(f"Recording problem: {message}")
+        if self.error_callback:
+            try:
+                self.error_callback(message)
+            except Exception as e:
+                print(f"Recording error callback failed: {e}")
+    
+    def _new_chunk_file(self) -> _ChunkFile:
+        """Create and map the next chunk file of the current session"""
+        self._chunk_count += 1
+        return _ChunkFile(self.data_dir, self.current_session['session_id'],
+                          self._chunk_count, self.chunk_capacity)
+    
+    def _prepare_spare(self):
+        """Writer job: map the chunk file that the next swap will switch to"""
+        self._spare = self._new_chunk_file()
+        self._spare_ready.set()
+    
+    def _close_chunk(self, chunk_file: _ChunkFile, chunk_info: Dict, session_chunks: List[Dict]):
+        """Writer job: flush a full chunk file and record it in the session"""
         try:
-            with open(chunk_path, 'w') as f:
-                json.dump(chunk_data, f, indent=2)
+            file_size = chunk_file.close(chunk_info['sample_count'])
             
             # Add chunk info to session
-            chunk_info = {
-                'chunk_id': chunk_id,
-                'filename': chunk_filename,
-                'start_time': self.chunk_start_time.isoformat(),
-                'end_time': datetime.utcnow().isoformat(),
-                'sample_count': len(self.data_buffer),
-                'file_size': os.path.getsize(chunk_path)
-            }
-            
-            self.current_session['chunks'].append(chunk_info)
+            chunk_info['file_size'] = file_size
+            session_chunks.append(chunk_info)
             
-            print(f"Saved chunk {chunk_id} with {len(self.data_buffer)} samples to {chunk_filename}")
+            print(f"Saved chunk {chunk_info['chunk_id']} with {chunk_info['sample_count']} samples to {chunk_info['filename']}")
             
         except Exception as e:
             print(f"Error saving chunk file: {e}")
     
+    def _writer_loop(self):
+        """Background thread that runs chunk file jobs in order"""
+        while True:
+            job = self._writer_queue.get()
+            try:
+                job()
+            except Exception as e:
+                print(f"Chunk writer error: {e}")
+            finally:
+                self._writer_queue.task_done()
+    
     def _save_session_file(self) -> str:
         """Save the complete session metadata file"""
         session_filename = f"{self.current_session['session_id']}_session.json"
@@ -192,14 +451,12 @@ class DataStorage:
         
         # Calculate total recording duration
         if self.current_session['chunks']:
-            start_time = datetime.fromisoformat(self.current_session['start_time'].replace('Z', '+00:00'))
-            end_time = datetime.fromisoformat(self.current_session['end_time'].replace('Z', '+00:00'))
-            duration = (end_time - start_time).total_seconds()
+            duration = (time.time_ns() - self._session_start_ns) / 1e9
             self.current_session['duration_seconds'] = duration
         
         try:
-            with open(session_path, 'w') as f:
-                json.dump(self.current_session, f, indent=2)
+            with open(session_path, 'wb') as f:
+                f.write(_dumps(self.current_session))
             
             return session_path
             
@@ -229,40 +486,44 @@ class DataStorage:
                 base_name = os.path.splitext(session_file)[0]
                 output_file = f"{base_name}.csv"
             
-            # Load all chunk data
-            all_data = []
-            for chunk_info in session_data['chunks']:
-                chunk_file = os.path.join(self.data_dir, chunk_info['filename'])
-                with open(chunk_file, 'r') as f:
-                    chunk_data = json.load(f)
-                    all_data.extend(chunk_data['data'])
+            levels = session_data.get('signal_quality_levels', SIGNAL_QUALITY_LEVELS)
+            # Sessions saved before the row layout was recorded used this one
+            row_dtype = ROW_DTYPE
+            if 'row_dtype' in session_data:
+                row_dtype = np.lib.format.descr_to_dtype(session_data['row_dtype'])
+            
+            fieldnames = ['timestamp']
+            fieldnames.extend([f'eeg_ch_{i}' for i in range(len(CHANNELS))])
+            fieldnames.extend(['battery_level', 'signal_quality'])
             
-            # Write CSV
+            # Write CSV one chunk at a time
             with open(output_file, 'w', newline='') as csvfile:
-                if not all_data:
-                    return output_file
-                
-                # Get headers from first data point
-                fieldnames = ['timestamp']
-                if 'eeg_data' in all_data[0]:
-                    fieldnames.extend([f'eeg_ch_{i}' for i in range(len(all_data[0]['eeg_data']))])
-                fieldnames.extend(['battery_level', 'signal_quality'])
-                
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
+                writer = csv.writer(csvfile)
+                writer.writerow(fieldnames)
                 
-                for data_point in all_data:
-                    row = {'timestamp': data_point['timestamp']}
+                for chunk_info in session_data['chunks']:
+                    chunk_file = os.path.join(self.data_dir, chunk_info['filename'])
                     
-                    # Add EEG channels
-                    if 'eeg_data' in data_point:
-                        for i, value in enumerate(data_point['eeg_data']):
-                            row[f'eeg_ch_{i}'] = value
+                    if chunk_file.endswith('.bin'):
+                        rows = np.fromfile(chunk_file, dtype=row_dtype)
+                        _write_csv_rows(csvfile, rows, levels)
+                        continue
                     
-                    row['battery_level'] = data_point.get('battery_level', '')
-                    row['signal_quality'] = data_point.get('signal_quality', '')
+                    # Legacy JSON chunk with one record per sample
+                    with open(chunk_file, 'rb') as f:
+                        chunk_data = _loads(f.read())
                     
-                    writer.writerow(row)
+                    for data_point in chunk_data['data']:
+                        eeg_values = data_point.get('eeg_data') or {}
+                        if isinstance(eeg_values, dict):
+                            eeg_values = [eeg_values.get(name, '') for name in CHANNELS]
+                        
+                        writer.writerow((
+                            data_point['timestamp'],
+                            *eeg_values,
+                            data_point.get('battery_level', ''),
+                            data_point.get('signal_quality', '')
+                        ))
             
             print(f"Exported session data to CSV: {output_file}")
             return output_file
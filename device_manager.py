@@ -4,9 +4,15 @@ Handles device discovery, connection, and data acquisition using pyneurosdk2
 """
 
 import time
-import threading
+import logging
+import types
+import concurrent.futures
 from typing import List, Dict, Optional, Callable
-from datetime import datetime
+
+import numpy as np
+
+# SDK callbacks run on native threads; anything they signal must be native too
+from native_threads import threading, blocking, wait, sleep
 
 try:
     from neurosdk.scanner import Scanner
@@ -33,57 +39,166 @@ except ImportError:
     class SensorState:
         StateInRange = "StateInRange"
 
+log = logging.getLogger(__name__)
+
+
+class EEGChunk:
+    """
+    Batch of consecutive EEG samples from one SDK packet or mock poll
+    
+    channels is an (N, 4) float32 array with columns O1, O2, T3, T4;
+    sample i was taken at t0_ns + i * dt_ns.
+    """
+    __slots__ = ('t0_ns', 'dt_ns', 'channels', 'packet_number', 'signal_quality')
+    
+    def __init__(self, t0_ns: int, dt_ns: int, channels: np.ndarray,
+                 packet_number: int = 0, signal_quality: str = 'good'):
+        self.t0_ns = t0_ns
+        self.dt_ns = dt_ns
+        self.channels = channels
+        self.packet_number = packet_number
+        self.signal_quality = signal_quality
+
 
 class BrainBitManager:
     """Manages BrainBit device operations"""
     
+    DEVICE_INFO_TTL = 0.5  # seconds to reuse get_device_info results
+    SAMPLE_RATE = 250  # Hz, BrainBit signal rate
+    SAMPLE_PERIOD_NS = 1_000_000_000 // SAMPLE_RATE
+    POLL_INTERVAL = 0.1  # seconds between polls when the sensor can't push data
+    MOCK_BATCH_SIZE = int(SAMPLE_RATE * POLL_INTERVAL)  # Samples per mock poll
+    BATTERY_TTL = 5.0  # seconds to reuse a battery reading
+    DROP_LOG_INTERVAL = 5.0  # seconds between repeated dropped-sample warnings
+    
     def __init__(self):
         self.scanner = None
         self.sensor = None
         self.is_scanning = False
         self._data_callback = None
         self._monitoring_thread = None
-        self._stop_monitoring = False
+        self._stop_evt = threading.Event()  # Set to stop the monitoring thread
         self._discovered_sensors = {}  # Store discovered sensors by ID
         self._recording_callback = None  # Callback for data recording
+        self._recording_error_callback = None  # Told why a recording was cut off
+        self._info_cache = (0.0, None)  # (monotonic time, device info)
+        self._battery_cache = (0, None)  # (battery level, monotonic time read)
+        self._drop_logged_at = float('-inf')  # Last dropped-sample warning
+        
+        # Filled by the scanner's sensorsChanged callback during a scan
+        self._scan_event = threading.Event()
+        self._scan_lock = threading.Lock()
+        self._scanned_sensors = []
+        
+        # Scans and connects run one at a time off the caller's thread. Under
+        # eventlet the executor's worker is green, so each job is handed on to
+        # a native thread with blocking() and its future resolves on the hub.
+        self._scan_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._last_scan = None  # Future of the most recent scan
+        self._submit_lock = threading.Lock()  # Guards the check-then-submit of scans
+        
+        # Set by the sensor's sensorStateChanged callback when it comes in range
+        self._state_event = threading.Event()
+        self._connected = False  # Kept current by the same callback
+        
+        # SDK features of the current sensor, probed once when it is bound
+        self._caps = self._probe_caps(None)
+        self._collect_impl = self._collect_mock  # Bound per sensor in connect_device
+        self._rng = np.random.default_rng()  # Mock signal source
     
     def scan_devices(self, timeout_seconds: int = 10) -> List[Dict]:
         """
-        Scan for available BrainBit devices
+        Scan for available BrainBit devices, blocking until done
         
         Returns:
             List of device info dictionaries
         """
+        return self.scan_devices_async(timeout_seconds).result()
+    
+    def scan_devices_async(self, timeout_seconds: int = 10) -> concurrent.futures.Future:
+        """
+        Start scanning for BrainBit devices in the background. A scan that is
+        still running is reused rather than queueing another.
+        
+        Returns:
+            Future resolving to the list of device info dictionaries
+        """
+        with self._submit_lock:
+            scan = self._last_scan
+            if scan is None or scan.done():
+                scan = self._scan_executor.submit(blocking, self._scan_devices, timeout_seconds)
+                self._last_scan = scan
+            return scan
+    
+    def scan_status(self) -> Dict:
+        """
+        State of the most recent scan
+        
+        Returns:
+            Dictionary with 'scanning' and the found 'devices' (None until a
+            scan has finished)
+        """
+        scan = self._last_scan
+        if scan is None or not scan.done():
+            return {'scanning': scan is not None, 'devices': None}
+        return {'scanning': False, 'devices': scan.result()}
+    
+    def connect_device_async(self, device_id: str) -> concurrent.futures.Future:
+        """
+        Connect to a device in the background. Runs on the scan executor, so
+        it never overlaps a scan.
+        
+        Returns:
+            Future resolving to the connect_device result
+        """
+        return self._scan_executor.submit(blocking, self.connect_device, device_id)
+    
+    def disconnect_async(self) -> concurrent.futures.Future:
+        """
+        Disconnect in the background, on the scan executor, so the BLE calls
+        and monitoring thread join run after any pending scan or connect.
+        
+        Returns:
+            Future resolving once disconnect has finished
+        """
+        return self._scan_executor.submit(blocking, self.disconnect)
+    
+    def _scan_devices(self, timeout_seconds: int) -> List[Dict]:
+        """Run one device scan on the scan executor"""
         try:
             # Initialize scanner for BrainBit devices
+            # A previous scan's scanner must not report into this one
+            self._release_scanner()
+            self._scan_event.clear()
+            with self._scan_lock:
+                self._scanned_sensors = []
             self.scanner = Scanner([SensorFamily.LEBrainBit])
+            self.scanner.sensorsChanged = self._on_sensors_changed
             self.scanner.start()
             self.is_scanning = True
             
-            print(f"Scanning for BrainBit devices for {timeout_seconds} seconds...")
-            time.sleep(timeout_seconds)
+            # Return as soon as a device is advertised, or after the timeout
+            print(f"Scanning for BrainBit devices (up to {timeout_seconds} seconds)...")
+            wait(self._scan_event, timeout_seconds)
             
             # Get discovered devices
-            sensors = self.scanner.sensors()
-            devices = []
-            
-            for sensor_info in sensors:
-                try:
-                    # sensor_info is a SensorInfo object, we need to extract info and create Sensor
-                    sensor_id = sensor_info.address if hasattr(sensor_info, 'address') else str(id(sensor_info))
-                    device_info = {
-                        'id': sensor_id,
-                        'name': sensor_info.name if hasattr(sensor_info, 'name') else 'BrainBit Device',
-                        'address': sensor_info.address if hasattr(sensor_info, 'address') else 'Unknown',
-                        'sensor_family': 'BrainBit'
-                    }
-                    devices.append(device_info)
-                    
-                    # Store the SensorInfo object - we'll create the actual Sensor during connection
-                    self._discovered_sensors[sensor_id] = sensor_info
-                        
-                except Exception as e:
-                    print(f"Error processing device info: {e}")
+            with self._scan_lock:
+                sensors = list(self._scanned_sensors)
+            if not sensors:
+                sensors = self.scanner.sensors()
+            
+            # Store the SensorInfo objects by address - we'll create the actual
+            # Sensor during connection. The address stays stable across scans.
+            self._discovered_sensors = {si.Address: si for si in sensors}
+            devices = [
+                {
+                    'id': si.Address,
+                    'name': si.Name,
+                    'address': si.Address,
+                    'sensor_family': 'BrainBit'
+                }
+                for si in self._discovered_sensors.values()
+            ]
             
             # Don't stop the scanner yet - we need it for connection
             self.is_scanning = False
@@ -98,6 +213,68 @@ class BrainBitManager:
             self.is_scanning = False
             return []
     
+    def _release_scanner(self):
+        """Detach and stop the scanner of an earlier scan, if any"""
+        scanner, self.scanner = self.scanner, None
+        if scanner is None:
+            return
+        try:
+            scanner.sensorsChanged = None
+            scanner.stop()
+        except Exception as e:
+            print(f"Error stopping previous scanner: {e}")
+    
+    def _on_sensors_changed(self, scanner, sensors):
+        """Scanner callback with the current list of advertised sensors"""
+        if scanner is not self.scanner:
+            return  # Late callback from an earlier scan's scanner
+        with self._scan_lock:
+            self._scanned_sensors = list(sensors)
+        if sensors:
+            self._scan_event.set()
+    
+    @staticmethod
+    def _probe_caps(sensor) -> types.SimpleNamespace:
+        """Record which SDK features a sensor object exposes (all False for None)"""
+        return types.SimpleNamespace(
+            state_attr=hasattr(sensor, 'state'),
+            push=hasattr(sensor, 'signalDataReceived'),
+            read_signal=callable(getattr(sensor, 'read_signal_data', None)),
+            exec_cmd=callable(getattr(sensor, 'exec_command', None)),
+            cmd_query=callable(getattr(sensor, 'is_supported_command', None)),
+            set_param=callable(getattr(sensor, 'set_parameter', None)),
+            # Looked up on the class: reading the property is a BLE call
+            batt_power=hasattr(type(sensor), 'batt_power'),
+            can_start=False,  # Filled in by _probe_commands once in range
+            can_stop=False
+        )
+    
+    def _probe_commands(self):
+        """
+        Ask the in-range sensor once which signal commands it supports.
+        Command support is a BLE query, so it only answers reliably in range.
+        """
+        caps = self._caps
+        if caps.exec_cmd and caps.cmd_query:
+            caps.can_start = self._supports_command(SensorCommand.StartSignal)
+            caps.can_stop = self._supports_command(SensorCommand.StopSignal)
+    
+    def _supports_command(self, command) -> bool:
+        """Query one command; a failed query counts as unsupported"""
+        try:
+            return bool(self.sensor.is_supported_command(command))
+        except Exception as e:
+            print(f"Could not query support for {command}: {e}")
+            return False
+    
+    def _on_sensor_state_changed(self, sensor, state):
+        """Sensor callback for connection state changes"""
+        if sensor is not self.sensor:
+            return  # Late callback from a sensor that was disconnected
+        self._connected = state == SensorState.StateInRange
+        if self._connected:
+            self._state_event.set()
+    
     def connect_device(self, device_id: str) -> bool:
         """
         Connect to a specific BrainBit device
@@ -108,6 +285,9 @@ class BrainBitManager:
         Returns:
             True if connection successful, False otherwise
         """
+        self._info_cache = (0.0, None)
+        self._battery_cache = (0, None)
+        
         try:
             # Find the sensor in our stored discovered sensors
             if device_id not in self._discovered_sensors:
@@ -135,14 +315,20 @@ class BrainBitManager:
             
             # Set the sensor (create_sensor already connects according to docs)
             print(f"Setting up connection to device {device_id}...")
+            self._state_event.clear()
+            self._connected = False
             self.sensor = target_sensor
+            self._caps = self._probe_caps(self.sensor)
+            self._collect_impl = self._collect_real if self._caps.read_signal else self._collect_mock
+            try:
+                self.sensor.sensorStateChanged = self._on_sensor_state_changed
+            except Exception as e:
+                print(f"Could not register state callback: {e}")
             
             # Check connection state (BrainBit uses .state attribute, not .is_connected())
-            if hasattr(self.sensor, 'state'):
+            if self._caps.state_attr:
                 if self.sensor.state == SensorState.StateInRange:
-                    print(f"Successfully connected to BrainBit device: {device_id}")
-                    # Start continuous data monitoring for live visualization
-                    self._start_continuous_monitoring()
+                    self._start_in_range(device_id)
                     return True
                 else:
                     print(f"Device state: {self.sensor.state}, attempting to wait for connection...")
@@ -150,22 +336,15 @@ class BrainBitManager:
             # Wait for connection to establish (create_sensor is blocking but may take time)
             max_wait = 15  # seconds - increased timeout for BrainBit
             print(f"Waiting for device to come in range (max {max_wait} seconds)...")
-            for i in range(max_wait * 10):
-                try:
-                    if hasattr(self.sensor, 'state') and self.sensor.state == SensorState.StateInRange:
-                        print(f"Successfully connected to BrainBit device: {device_id}")
-                        # Configure hardware filters for dry electrode artifact removal
-                        self._configure_hardware_filters()
-                        # Start continuous data monitoring for live visualization
-                        self._start_continuous_monitoring()
-                        return True
-                    if i % 10 == 0:  # Print progress every second
-                        current_state = getattr(self.sensor, 'state', 'unknown')
-                        print(f"Connection attempt {i//10 + 1}/{max_wait}, state: {current_state}")
-                except Exception as e:
-                    if i % 10 == 0:
-                        print(f"Connection attempt {i//10 + 1}/{max_wait}, error checking state: {e}")
-                time.sleep(0.1)
+            wait(self._state_event, max_wait)
+            
+            try:
+                if self._caps.state_attr and self.sensor.state == SensorState.StateInRange:
+                    self._start_in_range(device_id)
+                    return True
+                print(f"Device state after waiting: {getattr(self.sensor, 'state', 'unknown')}")
+            except Exception as e:
+                print(f"Error checking device state: {e}")
             
             print("Connection timeout - device may be out of range or in use by another application")
             return False
@@ -174,21 +353,46 @@ class BrainBitManager:
             print(f"Connection error: {e}")
             return False
     
+    def _start_in_range(self, device_id: str):
+        """Finish connecting to a sensor that is in range"""
+        print(f"Successfully connected to BrainBit device: {device_id}")
+        self._connected = True
+        # Configure hardware filters for dry electrode artifact removal. The
+        # BLE write blocks, so it runs on a native thread, never on the hub.
+        blocking(self._configure_hardware_filters)
+        # Start continuous data monitoring for live visualization
+        self._start_continuous_monitoring()
+    
     def disconnect(self):
         """Disconnect from current device"""
+        self._info_cache = (0.0, None)
+        self._battery_cache = (0, None)
+        
+        self._connected = False
+        
         try:
-            self._stop_monitoring = True
+            self._stop_evt.set()
+            if self._monitoring_thread and self._monitoring_thread.is_alive():
+                blocking(self._monitoring_thread.join, 1.0)
+            self._monitoring_thread = None
+            
+            caps = self._caps
+            if self.sensor is not None:
+                try:
+                    self.sensor.sensorStateChanged = None
+                except Exception as e:
+                    print(f"Could not detach state callback: {e}")
+            if caps.push:
+                self.sensor.signalDataReceived = None
             
             # Stop signal acquisition if active
-            if self.sensor and hasattr(self.sensor, 'execute_command'):
+            if caps.can_stop:
                 try:
-                    if hasattr(self.sensor, 'is_supported_command'):
-                        if self.sensor.is_supported_command(SensorCommand.StopSignal):
-                            self.sensor.execute_command(SensorCommand.StopSignal)
+                    self.sensor.exec_command(SensorCommand.StopSignal)
                 except Exception as e:
                     print(f"Error stopping signal: {e}")
             
-            if self.sensor and hasattr(self.sensor, 'state'):
+            if caps.state_attr:
                 if self.sensor.state == SensorState.StateInRange:
                     self.sensor.disconnect()
                     print("Disconnected from BrainBit device")
@@ -197,27 +401,34 @@ class BrainBitManager:
                 self.scanner.stop()
             
             self.sensor = None
+            self._caps = self._probe_caps(None)
+            self._collect_impl = self._collect_mock
             self.scanner = None
             self._discovered_sensors.clear()  # Clear stored sensors
             self._data_callback = None
             self._recording_callback = None
+            self._recording_error_callback = None
             
         except Exception as e:
             print(f"Disconnection error: {e}")
     
     def is_connected(self) -> bool:
-        """Check if device is currently connected"""
-        try:
-            if self.sensor is None:
-                return False
-            if hasattr(self.sensor, 'state'):
-                return self.sensor.state == SensorState.StateInRange
-            return False
-        except:
-            return False
+        """Check if device is currently connected (tracked from sensor state callbacks)"""
+        return self._connected
     
     def get_device_info(self) -> Optional[Dict]:
-        """Get information about connected device"""
+        """Get information about connected device, cached for DEVICE_INFO_TTL"""
+        now = time.monotonic()
+        cached_at, info = self._info_cache
+        if info is not None and now - cached_at < self.DEVICE_INFO_TTL:
+            return info
+        
+        info = self._query_device_info()
+        self._info_cache = (now, info)
+        return info
+    
+    def _query_device_info(self) -> Optional[Dict]:
+        """Read device information from the sensor"""
         if not self.is_connected():
             return None
         
@@ -227,7 +438,8 @@ class BrainBitManager:
                 'address': getattr(self.sensor, 'address', 'Unknown'),
                 'connected': True,
                 'battery_level': self._get_battery_level(),
-                'signal_quality': 'good'  # Simplified for now
+                'signal_quality': 'good',  # Simplified for now
+                'mock_data': self.uses_mock_data()
             }
         except Exception as e:
             print(f"Error getting device info: {e}")
@@ -243,23 +455,30 @@ class BrainBitManager:
                 'connected': True,
                 'battery_level': self._get_battery_level(),
                 'signal_quality': 'good',  # Simplified
-                'timestamp': datetime.utcnow().isoformat()
+                'timestamp_ns': time.time_ns()
             }
         except Exception as e:
-            print(f"Error getting device status: {e}")
+            log.warning("Error getting device status: %s", e)
             return {'connected': False, 'error': str(e)}
     
-    def start_recording(self, data_callback: Callable = None):
+    def uses_mock_data(self) -> bool:
+        """True if the samples delivered for this sensor are generated, not read"""
+        return not self._caps.push and self._collect_impl == self._collect_mock
+    
+    def start_recording(self, data_callback: Callable = None, error_callback: Callable = None):
         """
         Start recording EEG data from device (for storage)
         
         Args:
             data_callback: Function to call with each data chunk for storage
+            error_callback: Function called with a message if the recording
+                is cut off because the sensor stopped delivering real data
         """
         if not self.is_connected():
             raise Exception("No device connected")
         
         # Set the recording callback (different from live monitoring callback)
+        self._recording_error_callback = error_callback
         self._recording_callback = data_callback
         
         print("Started EEG data recording")
@@ -269,18 +488,24 @@ class BrainBitManager:
         if self._monitoring_thread and self._monitoring_thread.is_alive():
             return  # Already monitoring
         
-        self._stop_monitoring = False
+        self._stop_evt.clear()
         
         try:
-            # Start signal acquisition if available
-            if hasattr(self.sensor, 'execute_command') and hasattr(self.sensor, 'SensorCommand'):
-                # Check if signal is supported
-                if hasattr(self.sensor, 'is_supported_command'):
-                    if self.sensor.is_supported_command(SensorCommand.StartSignal):
-                        self.sensor.execute_command(SensorCommand.StartSignal)
-                        print("Started signal acquisition for live monitoring")
+            # Subscribe before starting the signal so the first packets are not missed
+            if self._caps.push:
+                self.sensor.signalDataReceived = self._on_signal_data
+            
+            # Start signal acquisition if supported
+            self._probe_commands()
+            if self._caps.can_start:
+                self.sensor.exec_command(SensorCommand.StartSignal)
+                print("Started signal acquisition for live monitoring")
+            
+            if self._caps.push:
+                print("Started continuous EEG data monitoring (SDK push)")
+                return
             
-            # Start data monitoring thread for live visualization
+            # No push callbacks (mock sensor) - poll from a monitoring thread
             self._monitoring_thread = threading.Thread(
                 target=self._continuous_monitoring_loop,
                 daemon=True
@@ -297,6 +522,7 @@ class BrainBitManager:
         try:
             # Just clear the recording callback, keep live monitoring active
             self._recording_callback = None
+            self._recording_error_callback = None
             
             print("Stopped EEG data recording")
             
@@ -304,129 +530,173 @@ class BrainBitManager:
             print(f"Error stopping recording: {e}")
             raise
     
+    def _on_signal_data(self, sensor, data):
+        """Sensor callback receiving every BrainBitSignalData packet pushed by the SDK"""
+        if not data or not (self._data_callback or self._recording_callback):
+            return
+        
+        try:
+            data_chunk = self._signal_chunk(data)
+        except Exception:
+            self._warn_dropped("Could not unpack signal data")
+            return
+        
+        self._dispatch_chunk(data_chunk)
+    
+    def _dispatch_chunk(self, data_chunk: EEGChunk):
+        """Hand a chunk to the live and recording callbacks, isolating their failures"""
+        data_callback = self._data_callback
+        recording_callback = self._recording_callback
+        
+        # Live visualization callback (always active when connected).
+        # Runs for every packet; a failing frame only costs the display.
+        if data_callback:
+            try:
+                data_callback(data_chunk)
+            except Exception:
+                log.debug("Live data callback error", exc_info=True)
+        
+        # Recording callback (only when recording)
+        if recording_callback:
+            try:
+                recording_callback(data_chunk)
+            except Exception:
+                self._warn_dropped("Recording callback error")
+    
+    def _warn_dropped(self, reason: str):
+        """Log lost samples from an except block, at most once per DROP_LOG_INTERVAL"""
+        now = time.monotonic()
+        if now - self._drop_logged_at >= self.DROP_LOG_INTERVAL:
+            self._drop_logged_at = now
+            log.warning("%s - samples were dropped", reason, exc_info=True)
+    
+    def _signal_chunk(self, samples) -> EEGChunk:
+        """Pack a list of BrainBitSignalData into one EEGChunk"""
+        n = len(samples)
+        channels = np.array(
+            [(s.O1, s.O2, s.T3, s.T4) for s in samples], dtype=np.float32
+        ).reshape(n, 4)
+        
+        # Packets arrive after their last sample; date the batch back to its first
+        t0_ns = time.time_ns() - (n - 1) * self.SAMPLE_PERIOD_NS
+        return EEGChunk(t0_ns, self.SAMPLE_PERIOD_NS, channels, samples[0].PackNum)
+    
     def _continuous_monitoring_loop(self):
-        """Background thread for continuous monitoring and live visualization"""
-        sample_count = 0
+        """Polling fallback for sensors without push callbacks (mock mode)"""
+        # Polls are pinned to a fixed monotonic schedule so the time spent
+        # collecting and dispatching doesn't stretch the period
+        period = self.POLL_INTERVAL
+        next_t = time.monotonic() + period
         
-        while not self._stop_monitoring and self.is_connected():
+        while not self._stop_evt.is_set() and self.is_connected():
             try:
-                # Collect data for live visualization
+                # Collect data for live visualization and recording
                 data_chunk = self._collect_data_chunk()
+                if data_chunk:
+                    self._dispatch_chunk(data_chunk)
                 
-                # Send to live visualization callback (always active when connected)
-                if data_chunk and self._data_callback:
-                    self._data_callback(data_chunk)
-                
-                # Send to recording callback (only when recording)
-                if data_chunk and hasattr(self, '_recording_callback') and self._recording_callback:
-                    self._recording_callback(data_chunk)
-                
-                sample_count += 1
-                time.sleep(0.1)  # ~10 Hz display update rate (much slower for readability)
-                
-            except Exception as e:
-                print(f"Continuous monitoring error: {e}")
-                time.sleep(0.1)  # Brief pause before retrying
+            except Exception:
+                log.debug("Continuous monitoring error", exc_info=True)
+            
+            slack = next_t - time.monotonic()
+            next_t += period
+            if slack > 0 and self._stop_evt.wait(slack):
+                break
     
-    def _collect_data_chunk(self) -> Optional[Dict]:
+    def _collect_data_chunk(self) -> Optional[EEGChunk]:
         """
-        Collect a single data chunk from the device using actual BrainBit SDK
+        Collect a data chunk using the reader bound for the current sensor
         """
+        return self._collect_impl()
+    
+    def _collect_real(self) -> Optional[EEGChunk]:
+        """Read every sample buffered by the BrainBit SDK since the last poll"""
         try:
-            if not self.sensor or not hasattr(self.sensor, 'read_signal_data'):
-                # Fallback to mock data if SDK not available
-                import random
-                
-                channel_data = {
-                    'O1': random.uniform(-100, 100),
-                    'O2': random.uniform(-100, 100), 
-                    'T3': random.uniform(-100, 100),
-                    'T4': random.uniform(-100, 100)
-                }
-                
-                return {
-                    'timestamp': datetime.utcnow().isoformat(),
-                    'eeg_data': channel_data,
-                    'battery_level': self._get_battery_level(),
-                    'signal_quality': 'good',
-                    'sample_rate': 250
-                }
-            
-            # Try to read actual BrainBit signal data
             signal_data = self.sensor.read_signal_data()
-            
-            if signal_data and len(signal_data) > 0:
-                # Get the most recent data point
-                latest_data = signal_data[-1]
-                
-                channel_data = {
-                    'O1': latest_data.O1,
-                    'O2': latest_data.O2,
-                    'T3': latest_data.T3,
-                    'T4': latest_data.T4
-                }
-                
-                return {
-                    'timestamp': datetime.utcnow().isoformat(),
-                    'eeg_data': channel_data,
-                    'packet_number': latest_data.PackNum,
-                    'marker': latest_data.Marker,
-                    'battery_level': self._get_battery_level(),
-                    'signal_quality': 'good',
-                    'sample_rate': 250
-                }
-            else:
-                # No data available yet, return None
-                return None
-                
         except Exception as e:
-            print(f"Error collecting data: {e}")
-            # Fallback to mock data with proper channel structure
-            import random
-            
-            channel_data = {
-                'O1': random.uniform(-100, 100),
-                'O2': random.uniform(-100, 100), 
-                'T3': random.uniform(-100, 100),
-                'T4': random.uniform(-100, 100)
-            }
-            
-            return {
-                'timestamp': datetime.utcnow().isoformat(),
-                'eeg_data': channel_data,
-                'battery_level': self._get_battery_level(),
-                'signal_quality': 'good',
-                'sample_rate': 250
-            }
+            log.warning("Error collecting data, falling back to mock data: %s", e)
+            self._collect_impl = self._collect_mock
+            self._info_cache = (0.0, None)  # Report mock_data from now on
+            self._end_recording_on_mock(f"Sensor read failed: {e}")
+            return self._collect_mock()
+        
+        if not signal_data:
+            # No data available yet
+            return None
+        
+        # Every sample read since the last poll, as one batch
+        return self._signal_chunk(signal_data)
+    
+    def _end_recording_on_mock(self, reason: str):
+        """Stop feeding a running recording, so mock samples never end up in it"""
+        if not self._recording_callback:
+            return
+        
+        error_callback = self._recording_error_callback
+        self._recording_callback = self._recording_error_callback = None
+        log.error("%s - recording stopped, live view continues with mock data", reason)
+        if error_callback:
+            try:
+                error_callback(f"{reason}; recording stopped early")
+            except Exception:
+                log.warning("Recording error callback failed", exc_info=True)
+    
+    def _collect_mock(self) -> EEGChunk:
+        """Generate a mock data chunk when the SDK can't provide signal data"""
+        n = self.MOCK_BATCH_SIZE
+        # Drawn straight into float32 and scaled to [-100, 100) in place
+        channels = self._rng.random((n, 4), dtype=np.float32)
+        channels *= 200.0
+        channels -= 100.0
+        
+        t0_ns = time.time_ns() - (n - 1) * self.SAMPLE_PERIOD_NS
+        return EEGChunk(t0_ns, self.SAMPLE_PERIOD_NS, channels)
     
     def _configure_hardware_filters(self):
-        """Configure BrainBit hardware filters to remove dry electrode artifacts"""
-        try:
-            if not self.sensor or not hasattr(self.sensor, 'set_parameter'):
-                print("Cannot configure hardware filters - sensor not available")
+        """
+        Configure BrainBit hardware filters to remove dry electrode artifacts.
+        Runs before StartSignal so streaming starts with the filter applied.
+        """
+        sensor = self.sensor
+        if not self._caps.set_param:
+            print("Cannot configure hardware filters - sensor not available")
+            return
+        
+        # According to BrainBit documentation: use 1Hz high-pass filter to remove delta artifacts
+        # This is the recommended approach for dry electrodes
+        print("Configuring BrainBit hardware filters for dry electrode artifact removal...")
+        
+        for attempt in range(2):
+            try:
+                # Set 1Hz high-pass filter to remove electrochemical artifacts
+                hpf_1hz = SensorFilter.HPFBwhLvl1CutoffFreq1Hz
+                sensor.set_parameter(SensorParameter.HardwareFilterState, hpf_1hz)
+                
+                print("✅ Applied BrainBit hardware filter: 1Hz high-pass (removes delta artifacts)")
                 return
-            
-            # According to BrainBit documentation: use 1Hz high-pass filter to remove delta artifacts
-            # This is the recommended approach for dry electrodes
-            print("Configuring BrainBit hardware filters for dry electrode artifact removal...")
-            
-            # Set 1Hz high-pass filter to remove electrochemical artifacts
-            hpf_1hz = SensorFilter.HPFBwhLvl1CutoffFreq1Hz
-            self.sensor.set_parameter(SensorParameter.HardwareFilterState, hpf_1hz)
-            
-            print("✅ Applied BrainBit hardware filter: 1Hz high-pass (removes delta artifacts)")
-            
-        except Exception as e:
-            print(f"⚠️ Could not configure hardware filters: {e}")
-            print("Proceeding without hardware filtering - software filtering will be used instead")
+                
+            except Exception as e:
+                if attempt == 0:
+                    sleep(0.1)  # One retry for a transient BLE write failure
+                    continue
+                print(f"⚠️ Could not configure hardware filters: {e}")
+                print("Proceeding without hardware filtering - software filtering will be used instead")
     
     def _get_battery_level(self) -> int:
-        """Get device battery level (0-100)"""
-        try:
-            # Replace with actual SDK call
-            if hasattr(self.sensor, 'read_parameter'):
-                # return self.sensor.read_parameter(SensorParameter.BattPower)
-                pass
-            return 85  # Mock value
-        except:
-            return 0
+        """Get device battery level (0-100), cached for BATTERY_TTL"""
+        now = time.monotonic()
+        level, read_at = self._battery_cache
+        if read_at is not None and now - read_at < self.BATTERY_TTL:
+            return level
+        
+        if not self._caps.batt_power:
+            level = 85  # Mock sensor without a battery reading
+        else:
+            try:
+                # The batt_power property is a BLE read, kept off the eventlet hub
+                level = int(blocking(getattr, self.sensor, 'batt_power'))
+            except Exception as e:
+                log.warning("Could not read battery level: %s", e)
+                level = 0
+        self._battery_cache = (level, now)
+        return level
@@ -0,0 +1,38 @@
+"""
+Native Threading Primitives
+OS-level threading and queue objects for state shared with pyneurosdk2
+callback threads, which stay usable when the app runs under eventlet
+"""
+
+try:
+    from eventlet import patcher, tpool
+    EVENTLET_AVAILABLE = True
+except ImportError:
+    EVENTLET_AVAILABLE = False
+
+if EVENTLET_AVAILABLE:
+    # eventlet.monkey_patch() turns threading/queue objects green, and green
+    # objects can't be signalled across OS threads. The SDK calls back on its
+    # own threads, so anything it touches is built from the original modules.
+    threading = patcher.original('threading')
+    queue = patcher.original('queue')
+    sleep = patcher.original('time').sleep
+else:
+    import threading
+    import queue
+    from time import sleep
+
+
+def blocking(func, *args):
+    """
+    Run a call that blocks on native primitives (Event.wait, Queue.join,
+    Thread.join) without stalling the eventlet hub when threads are patched
+    """
+    if EVENTLET_AVAILABLE and patcher.is_monkey_patched('thread'):
+        return tpool.execute(func, *args)
+    return func(*args)
+
+
+def wait(event, timeout: float = None) -> bool:
+    """Wait on a native Event; True if it was set before the timeout"""
+    return blocking(event.wait, timeout)
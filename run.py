@@ -4,11 +4,24 @@ Quick start script for Neuro Notes
 Handles setup and launches the application
 """
 
+# Patch before anything else imports threading or socket. On a first run
+# eventlet may not be installed yet; app.py patches again when imported.
+try:
+    import eventlet
+    eventlet.monkey_patch()
+except ImportError:
+    pass
+
 import os
 import sys
+import hashlib
+import logging
 import subprocess
 from pathlib import Path
 
+# Hash of the requirements.txt that was last installed successfully
+DEPS_MARKER = Path('data/.deps.sha256')
+
 def check_python_version():
     """Check if Python version is 3.7 or higher"""
     if sys.version_info < (3, 7):
@@ -19,29 +32,42 @@ def check_python_version():
     return True
 
 def install_dependencies():
-    """Install required Python packages"""
+    """
+    Install required Python packages, skipped if requirements.txt is unchanged
+    and was last installed into this same interpreter
+    """
+    digest = hashlib.sha256(sys.executable.encode())
+    digest.update(Path('requirements.txt').read_bytes())
+    requirements_hash = digest.hexdigest()
+    if DEPS_MARKER.exists() and DEPS_MARKER.read_text().strip() == requirements_hash:
+        print("✅ Dependencies up to date")
+        return True
+    
     print("📦 Installing dependencies...")
     try:
         subprocess.check_call([
-            sys.executable, "-m", "pip", "install", "-r", "requirements.txt"
+            sys.executable, "-m", "pip", "install",
+            "--disable-pip-version-check", "-q", "-r", "requirements.txt"
         ])
+        DEPS_MARKER.parent.mkdir(exist_ok=True)
+        DEPS_MARKER.write_text(requirements_hash)
         print("✅ Dependencies installed successfully")
         return True
     except subprocess.CalledProcessError as e:
         print(f"❌ Failed to install dependencies: {e}")
         return False
 
-def create_directories():
-    """Create necessary directories"""
+def create_directories(entries):
+    """Create necessary directories that are missing from entries"""
     directories = ['data', 'templates']
     for directory in directories:
-        Path(directory).mkdir(exist_ok=True)
+        if directory not in entries:
+            os.mkdir(directory)
     print("✅ Directories created")
 
-def setup_environment():
+def setup_environment(entries):
     """Set up environment variables if needed"""
-    env_file = Path('.env')
-    if not env_file.exists():
+    if '.env' not in entries:
         print("💡 No .env file found. Create one from env_template.txt for GitHub integration")
     else:
         print("✅ Environment file found")
@@ -59,21 +85,30 @@ def main():
     if not install_dependencies():
         return
     
+    # One listing of the working directory serves both setup checks
+    with os.scandir('.') as it:
+        entries = {entry.name for entry in it}
+    
     # Create directories
-    create_directories()
+    create_directories(entries)
     
     # Setup environment
-    setup_environment()
+    setup_environment(entries)
     
     print("\n🚀 Starting Neuro Notes...")
     print("📱 Open your browser to: http://localhost:5000")
     print("🛑 Press Ctrl+C to stop the application")
     print("-" * 40)
     
+    # Diagnostics from the data path only reach the console at WARNING and above
+    logging.basicConfig(level=logging.WARNING)
+    
     # Import and run the main app
     try:
         from app import app, socketio
-        socketio.run(app, debug=False, host='0.0.0.0', port=5000)
+        # No reloader, and no per-request Werkzeug logging on the data path
+        socketio.run(app, debug=False, host='0.0.0.0', port=5000,
+                     use_reloader=False, log_output=False)
     except KeyboardInterrupt:
         print("\n👋 Neuro Notes stopped")
     except ImportError as e:
@@ -0,0 +1,79 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from native_threads import EVENTLET_AVAILABLE
+from test_device_manager import run_patched
+
+
+@unittest.skipUnless(EVENTLET_AVAILABLE, "eventlet not installed")
+class RecordingTest(unittest.TestCase):
+
+    def test_stop_after_storage_cut_recording_short(self):
+        """A recording storage stopped early is reported and can still be stopped and saved"""
+        events, total, error = run_patched("""
+            import os, tempfile
+            os.chdir(tempfile.mkdtemp())  # app.py creates ./data on import
+            import eventlet
+            import app
+            from test_data_storage import make_chunk
+            storage = app.data_storage
+            storage.chunk_capacity = 100
+            storage.SPARE_TIMEOUT = 0.1
+            storage._prepare_spare = lambda: None  # Writer never readies the next file
+            app.device_manager._connected = True
+            app.device_manager.get_device_info = lambda: {'name': 'fake'}
+            app.start_live_data_pump()
+
+            client = app.socketio.test_client(app.app)
+            client.emit('start_recording')
+            storage.add_data_chunk(make_chunk(0, 150))
+            eventlet.sleep(0.2)  # Let the pump send the error
+            client.emit('stop_recording')
+
+            received = client.get_received()
+            names = [event['name'] for event in received]
+            stopped = next(event['args'][0] for event in received
+                           if event['name'] == 'recording_stopped')
+            session = storage.load_session(stopped['session_file'])
+            print('RESULT', ','.join(names), session['total_samples'],
+                  'error' in session, file=sys.stderr)
+        """)
+        self.assertEqual(events, 'status_update,recording_started,recording_error,recording_stopped')
+        self.assertEqual(total, '100')
+        self.assertEqual(error, 'True')
+
+
+    def test_live_pump_survives_a_failing_tick(self):
+        """An exception while sending one batch doesn't stop later live data"""
+        count, = run_patched("""
+            import os, tempfile
+            os.chdir(tempfile.mkdtemp())
+            import eventlet
+            import app
+            from test_data_storage import make_chunk
+            send_osc = app.send_osc
+            failures = [RuntimeError("OSC send failed")]
+
+            def flaky_osc(batch):
+                if failures:
+                    raise failures.pop()
+                send_osc(batch)
+            app.send_osc = flaky_osc
+            app.start_live_data_pump()
+
+            client = app.socketio.test_client(app.app)
+            app.handle_live_data_chunk(make_chunk(0, 10))  # Lost to the failing tick
+            eventlet.sleep(0.1)
+            app.handle_live_data_chunk(make_chunk(10, 10))
+            eventlet.sleep(0.1)
+            live = [event for event in client.get_received() if event['name'] == 'live_data']
+            print('RESULT', len(live), file=sys.stderr)
+        """)
+        self.assertEqual(count, '1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_storage
+from data_storage import DataStorage
+from device_manager import EEGChunk
+from native_threads import threading
+
+DT_NS = 4_000_000
+
+
+def make_chunk(start: int, n: int) -> EEGChunk:
+    """Batch of n samples whose O1 column counts up from start"""
+    channels = np.zeros((n, 4), dtype=np.float32)
+    channels[:, 0] = np.arange(start, start + n)
+    return EEGChunk(start * DT_NS, DT_NS, channels, start)
+
+
+class DataStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.storage = DataStorage(self.data_dir)
+        self.storage.chunk_capacity = 100  # Force frequent chunk rollovers
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def start(self):
+        self.storage.start_session({'session_id': 'session_test'})
+
+    def exported_rows(self, session_file):
+        csv_file = self.storage.export_session_csv(session_file)
+        with open(csv_file, newline='') as f:
+            return list(csv.reader(f))[1:]
+
+    def test_stop_while_samples_arrive(self):
+        """Stopping from another thread keeps every sample written before it"""
+        self.start()
+        errors = []
+        sent = [0]
+
+        def feed():
+            # Plays the SDK callback thread, which keeps delivering after stop
+            try:
+                while sent[0] < 20_000:
+                    self.storage.add_data_chunk(make_chunk(sent[0], 7))
+                    sent[0] += 7
+            except Exception as e:
+                errors.append(e)
+
+        feeder = threading.Thread(target=feed)
+        feeder.start()
+        deadline = time.monotonic() + 10
+        while sent[0] < 1000 and time.monotonic() < deadline:
+            time.sleep(0.001)  # Stop mid-stream, across several chunk files
+        session_file = self.storage.stop_session()
+        feeder.join()
+
+        self.assertEqual(errors, [])
+        session = self.storage.load_session(session_file)
+        rows = self.exported_rows(session_file)
+        values = [float(row[1]) for row in rows]
+        self.assertGreater(len(rows), 0)
+        self.assertEqual(len(rows), session['total_samples'])
+        self.assertEqual(values, list(range(len(values))))
+
+    def test_spare_not_ready_stops_recording(self):
+        """A writer that never prepares the next chunk file stops taking samples"""
+        self.storage.SPARE_TIMEOUT = 0.1
+        self.storage._prepare_spare = lambda: None
+        errors = []
+        self.storage.error_callback = errors.append
+        self.start()
+
+        self.storage.add_data_chunk(make_chunk(0, 150))
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(self.storage.recording)  # Open until stop_session saves it
+        self.storage.add_data_chunk(make_chunk(150, 10))  # Dropped
+
+        session_file = self.storage.stop_session()
+        session = self.storage.load_session(session_file)
+        self.assertIn('error', session)
+        self.assertEqual(session['total_samples'], 100)
+        self.assertEqual(len(self.exported_rows(session_file)), 100)
+
+    def test_stop_not_held_up_by_spare_wait(self):
+        """Waiting for the next chunk file doesn't hold the lock stop_session needs"""
+        self.storage.SPARE_TIMEOUT = 2.0
+        self.storage._prepare_spare = lambda: None
+        self.start()
+        feeder = threading.Thread(target=self.storage.add_data_chunk,
+                                  args=(make_chunk(0, 150),))
+        feeder.start()
+        deadline = time.monotonic() + 10
+        while self.storage._w < 100 and time.monotonic() < deadline:
+            time.sleep(0.01)  # Feeder fills the chunk, then waits for the spare
+        time.sleep(0.05)
+
+        started = time.monotonic()
+        session_file = self.storage.stop_session()
+        self.assertLess(time.monotonic() - started, 1.0)
+        feeder.join()
+
+        session = self.storage.load_session(session_file)
+        self.assertNotIn('error', session)
+        self.assertEqual(session['total_samples'], 100)
+
+    def test_flag_session(self):
+        """A flag is saved with a running session and ignored once it stopped"""
+        self.start()
+        self.storage.add_data_chunk(make_chunk(0, 10))
+        self.storage.flag_session("sensor read failed")
+        session_file = self.storage.stop_session()
+        self.storage.flag_session("too late")  # Session file is already written
+
+        session = self.storage.load_session(session_file)
+        self.assertEqual(session['error'], "sensor read failed")
+
+    def test_export_reads_chunks_with_recorded_layout(self):
+        """Chunks are read with the row layout saved in the manifest, not the current one"""
+        self.start()
+        self.storage.add_data_chunk(make_chunk(0, 150))
+        session_file = self.storage.stop_session()
+
+        packed = np.dtype([(name, data_storage.ROW_DTYPE[name]) for name in data_storage.ROW_DTYPE.names])
+        with mock.patch.object(data_storage, 'ROW_DTYPE', packed):  # Layout changed since
+            rows = self.exported_rows(session_file)
+        self.assertEqual([float(row[1]) for row in rows], list(range(150)))
+
+
+if __name__ == '__main__':
+    unittest.main()
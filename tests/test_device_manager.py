@@ -0,0 +1,488 @@
+import os
+import subprocess
+import sys
+import textwrap
+import time
+import unittest
+from types import SimpleNamespace
+from typing import List
+from unittest import mock
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TESTS)
+sys.path.insert(0, ROOT)
+
+import device_manager
+from device_manager import BrainBitManager, SensorState
+from native_threads import threading, EVENTLET_AVAILABLE
+
+
+def run_patched(script: str) -> List[str]:
+    """
+    Run script in a fresh interpreter monkey-patched as app.py is, with the
+    repo and tests importable, and return the fields of its RESULT line
+    """
+    preamble = textwrap.dedent(f"""
+        import eventlet
+        eventlet.monkey_patch()
+        import sys
+        sys.path[:0] = [{ROOT!r}, {TESTS!r}]
+    """)
+    result = subprocess.run([sys.executable, '-W', 'ignore', '-c', preamble + textwrap.dedent(script)],
+                            capture_output=True, text=True, timeout=60)
+    lines = [l for l in result.stderr.splitlines() if l.startswith('RESULT')]
+    if not lines:
+        raise AssertionError(f"No RESULT line from script:\n{result.stderr}")
+    return lines[-1].split()[1:]
+
+
+def start_ticker() -> List[int]:
+    """Count 50 ms green sleeps from now on; only useful under eventlet"""
+    import eventlet
+    ticks = [0]
+
+    def ticker():
+        while True:
+            eventlet.sleep(0.05)
+            ticks[0] += 1
+    eventlet.spawn(ticker)
+    return ticks
+
+
+class FakeSensor:
+    """Sensor that comes in range from a native thread, like the SDK's"""
+
+    def __init__(self, in_range_after: float):
+        self.state = None
+        self.sensorStateChanged = None
+        self.signalDataReceived = None
+        self._in_range_after = in_range_after
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def come_in_range(self):
+        def later():
+            time.sleep(self._in_range_after)
+            self.state = SensorState.StateInRange
+            self.sensorStateChanged(self, self.state)
+        threading.Thread(target=later, daemon=True).start()
+
+
+def connect_fake(manager: BrainBitManager, in_range_after: float = 0.2) -> bool:
+    sensor = FakeSensor(in_range_after)
+    manager._discovered_sensors['fake'] = sensor
+    sensor.come_in_range()
+    return manager.connect_device('fake')
+
+
+class StateEventTest(unittest.TestCase):
+
+    def test_native_state_change_wakes_connect(self):
+        """connect_device returns once the SDK reports StateInRange"""
+        manager = BrainBitManager()
+        started = time.monotonic()
+        self.assertTrue(connect_fake(manager))
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertTrue(manager.is_connected())
+
+    def test_old_sensor_callback_ignored_after_disconnect(self):
+        """A sensor dropped while out of range can't mark the manager connected"""
+        manager = BrainBitManager()
+        sensor = FakeSensor(0.05)
+        manager._discovered_sensors['fake'] = sensor
+        sensor.come_in_range()
+        self.assertTrue(manager.connect_device('fake'))
+        callback = sensor.sensorStateChanged
+
+        sensor.state = None  # Out of range, so disconnect skips sensor.disconnect()
+        manager.disconnect()
+        self.assertIsNone(sensor.sensorStateChanged)
+
+        callback(sensor, SensorState.StateInRange)  # Already queued by the SDK
+        self.assertFalse(manager.is_connected())
+
+    @unittest.skipUnless(EVENTLET_AVAILABLE, "eventlet not installed")
+    def test_native_state_change_wakes_connect_under_eventlet(self):
+        """Same, with the process monkey-patched as app.py does"""
+        ok, elapsed = run_patched("""
+            import time
+            from test_device_manager import BrainBitManager, connect_fake
+            started = time.monotonic()
+            ok = connect_fake(BrainBitManager())
+            print('RESULT', ok, time.monotonic() - started, file=sys.stderr)
+        """)
+        self.assertEqual(ok, 'True')
+        self.assertLess(float(elapsed), 5)
+
+
+class CommandSensor(FakeSensor):
+    """Fake sensor that only answers command queries once in range"""
+
+    def __init__(self, in_range_after: float, failing=()):
+        super().__init__(in_range_after)
+        self.failing = failing
+        self.executed = []
+
+    def is_supported_command(self, command):
+        if command in self.failing:
+            raise RuntimeError(f"{command} query failed")
+        return self.state == SensorState.StateInRange
+
+    def exec_command(self, command):
+        self.executed.append(command)
+
+
+FILTER = ('filter_state', 'hpf_1hz')
+
+
+def sdk_names():
+    """Stand-ins for the SDK enums the manager uses, absent without pyneurosdk2"""
+    return mock.patch.multiple(
+        device_manager, create=True,
+        SensorCommand=SimpleNamespace(StartSignal='start', StopSignal='stop'),
+        SensorParameter=SimpleNamespace(HardwareFilterState=FILTER[0]),
+        SensorFilter=SimpleNamespace(HPFBwhLvl1CutoffFreq1Hz=FILTER[1]))
+
+
+def connect_in_range(sensor) -> BrainBitManager:
+    manager = BrainBitManager()
+    manager._discovered_sensors['fake'] = sensor
+    sensor.come_in_range()
+    assert manager.connect_device('fake')
+    return manager
+
+
+@sdk_names()
+class CommandCapsTest(unittest.TestCase):
+
+    def connect(self, sensor):
+        return connect_in_range(sensor)
+
+    def test_commands_probed_once_in_range(self):
+        """Support queried before the device is in range isn't cached"""
+        sensor = CommandSensor(0.1)
+        manager = self.connect(sensor)
+        self.assertTrue(manager._caps.can_start)
+        self.assertTrue(manager._caps.can_stop)
+        self.assertEqual(sensor.executed, ['start'])
+
+        manager.disconnect()
+        self.assertEqual(sensor.executed, ['start', 'stop'])
+
+    def test_failed_query_only_clears_its_own_flag(self):
+        """A StopSignal query error leaves StartSignal support intact"""
+        manager = self.connect(CommandSensor(0.1, failing=('stop',)))
+        self.assertTrue(manager._caps.can_start)
+        self.assertFalse(manager._caps.can_stop)
+
+
+class SdkSensor(FakeSensor):
+    """
+    Fake with the pyneurosdk2 BrainBitSensor surface the manager relies on:
+    exec_command, is_supported_command and a signalDataReceived callback
+    """
+
+    def __init__(self, in_range_after: float):
+        super().__init__(in_range_after)
+        self.batteryChanged = None
+        self.executed = []
+
+    def is_supported_command(self, command):
+        return command in ('start', 'stop')
+
+    def exec_command(self, command):
+        self.executed.append(command)
+
+    def push(self, *samples):
+        """Deliver BrainBitSignalData-like packets as the SDK's signal thread does"""
+        self.signalDataReceived(self, [
+            SimpleNamespace(PackNum=i, Marker=0, O1=o1, O2=o2, T3=t3, T4=t4)
+            for i, (o1, o2, t3, t4) in enumerate(samples)
+        ])
+
+
+@sdk_names()
+class SdkSensorTest(unittest.TestCase):
+
+    def test_real_sensor_streams_pushed_samples(self):
+        """StartSignal goes out through exec_command and pushed packets reach the callbacks"""
+        sensor = SdkSensor(0.05)
+        manager = connect_in_range(sensor)
+        self.assertEqual(sensor.executed, ['start'])
+        self.assertIsNone(manager._monitoring_thread)
+        self.assertFalse(manager.uses_mock_data())
+
+        live, recorded = [], []
+        manager._data_callback = live.append
+        manager._recording_callback = recorded.append
+        sensor.push((1, 2, 3, 4), (5, 6, 7, 8))
+        self.assertEqual(len(live), 1)
+        self.assertEqual(recorded, live)
+        self.assertEqual(live[0].channels.tolist(), [[1, 2, 3, 4], [5, 6, 7, 8]])
+
+        manager.disconnect()
+        self.assertEqual(sensor.executed, ['start', 'stop'])
+        self.assertIsNone(sensor.signalDataReceived)
+
+
+class FilterSensor(CommandSensor):
+    """Command sensor that records hardware filter writes with the commands"""
+
+    def __init__(self, in_range_after: float, write_delay: float = 0):
+        super().__init__(in_range_after)
+        self.write_delay = write_delay
+
+    def set_parameter(self, parameter, value):
+        threading.Event().wait(self.write_delay)  # A native, blocking BLE write
+        self.executed.append((parameter, value))
+
+
+@sdk_names()
+class HardwareFilterTest(unittest.TestCase):
+
+    def test_filter_before_start_when_already_in_range(self):
+        """The fast path, sensor in range at once, also applies the filter"""
+        sensor = FilterSensor(0)
+        sensor.state = SensorState.StateInRange
+        manager = BrainBitManager()
+        manager._discovered_sensors['fake'] = sensor
+        self.assertTrue(manager.connect_device('fake'))
+        self.assertEqual(sensor.executed, [FILTER, 'start'])
+
+    def test_filter_before_start_after_waiting(self):
+        """The filter is written before StartSignal once the sensor is in range"""
+        sensor = FilterSensor(0.1)
+        connect_in_range(sensor)
+        self.assertEqual(sensor.executed, [FILTER, 'start'])
+
+    @unittest.skipUnless(EVENTLET_AVAILABLE, "eventlet not installed")
+    def test_filter_write_leaves_the_hub_running_under_eventlet(self):
+        """A slow filter write doesn't stall green threads"""
+        ok, ticks = run_patched("""
+            from test_device_manager import BrainBitManager, FilterSensor, sdk_names, start_ticker
+            from device_manager import SensorState
+            ticks = start_ticker()
+            sensor = FilterSensor(0, write_delay=0.5)
+            sensor.state = SensorState.StateInRange
+            manager = BrainBitManager()
+            manager._discovered_sensors['fake'] = sensor
+            with sdk_names():
+                ok = manager.connect_device('fake')
+            print('RESULT', ok and len(sensor.executed) == 2, ticks[0], file=sys.stderr)
+        """)
+        self.assertEqual(ok, 'True')
+        self.assertGreaterEqual(int(ticks), 5)  # ~10 if the hub kept running
+
+
+class BatterySensor:
+    """Sensor exposing only the SDK's batt_power property"""
+
+    def __init__(self, level):
+        self.level = level
+        self.reads = 0
+
+    @property
+    def batt_power(self):
+        self.reads += 1
+        if isinstance(self.level, Exception):
+            raise self.level
+        return self.level
+
+
+@sdk_names()
+class BatteryTest(unittest.TestCase):
+
+    def manager_for(self, sensor) -> BrainBitManager:
+        manager = BrainBitManager()
+        manager.sensor = sensor
+        manager._caps = manager._probe_caps(sensor)
+        return manager
+
+    def test_reads_batt_power_once_per_ttl(self):
+        """The level comes from batt_power and is cached for BATTERY_TTL"""
+        sensor = BatterySensor(42)
+        manager = self.manager_for(sensor)
+        self.assertEqual(sensor.reads, 0)  # Probing caps doesn't read the property
+        self.assertEqual(manager._get_battery_level(), 42)
+        sensor.level = 41
+        self.assertEqual(manager._get_battery_level(), 42)
+        self.assertEqual(sensor.reads, 1)
+
+    def test_failed_read_reports_zero(self):
+        manager = self.manager_for(BatterySensor(RuntimeError("BLE read failed")))
+        self.assertEqual(manager._get_battery_level(), 0)
+
+    def test_mock_sensor_keeps_mock_level(self):
+        self.assertEqual(self.manager_for(object())._get_battery_level(), 85)
+
+
+class FakeScanner:
+    """Scanner that reports its advertised sensors from a native thread once started"""
+
+    def __init__(self, advertised):
+        self.advertised = advertised
+        self.sensorsChanged = None
+        self.stopped = False
+
+    def start(self):
+        if self.advertised:
+            threading.Thread(target=self.sensorsChanged, args=(self, self.advertised),
+                             daemon=True).start()
+
+    def stop(self):
+        self.stopped = True
+
+    def sensors(self):
+        return self.advertised
+
+
+class ScanTest(unittest.TestCase):
+
+    def test_earlier_scanner_cannot_answer_a_new_scan(self):
+        """A late sensorsChanged from the previous scanner doesn't end the next scan"""
+        advertised = [[SimpleNamespace(Address='a', Name='A')], []]
+        with mock.patch.multiple(device_manager, create=True,
+                                 Scanner=lambda filters: FakeScanner(advertised.pop(0)),
+                                 SensorFamily=SimpleNamespace(LEBrainBit='brainbit')):
+            manager = BrainBitManager()
+            self.assertEqual([d['id'] for d in manager._scan_devices(5)], ['a'])
+            old = manager.scanner
+            callback = old.sensorsChanged
+
+            # Already queued by the SDK when the second scan starts
+            late = threading.Timer(0.05, callback, (old, [SimpleNamespace(Address='b', Name='B')]))
+            late.start()
+            self.assertEqual(manager._scan_devices(0.3), [])
+            late.join()
+
+        self.assertTrue(old.stopped)
+        self.assertIsNone(old.sensorsChanged)
+
+
+class ScanExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = BrainBitManager()
+        self.release = threading.Event()
+        self.scans = []
+
+        def slow_scan(timeout_seconds):
+            self.scans.append(timeout_seconds)
+            self.release.wait(5)
+            return [{'id': 'fake'}]
+        self.manager._scan_devices = slow_scan
+
+    def tearDown(self):
+        self.release.set()
+
+    def test_concurrent_requests_share_one_scan(self):
+        """Scan requests racing each other submit a single scan"""
+        self.assertEqual(self.manager.scan_status(), {'scanning': False, 'devices': None})
+        futures = []
+        threads = [threading.Thread(target=lambda: futures.append(self.manager.scan_devices_async()))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len({id(f) for f in futures}), 1)
+        self.assertTrue(self.manager.scan_status()['scanning'])
+        self.release.set()
+        futures[0].result(5)
+        self.assertEqual(self.scans, [10])
+        self.assertEqual(self.manager.scan_status(),
+                         {'scanning': False, 'devices': [{'id': 'fake'}]})
+
+    def test_connect_waits_for_running_scan(self):
+        """connect_device_async is queued behind the scan, not run beside it"""
+        self.manager._discovered_sensors['fake'] = sensor = FakeSensor(0.05)
+        scan = self.manager.scan_devices_async()
+        connect = self.manager.connect_device_async('fake')
+        time.sleep(0.1)
+        self.assertFalse(connect.done())
+
+        self.release.set()
+        scan.result(5)
+        sensor.come_in_range()
+        self.assertTrue(connect.result(10))
+
+    def test_disconnect_waits_for_running_connect(self):
+        """disconnect_async runs after a queued connect, so it can't be undone by it"""
+        self.manager._discovered_sensors['fake'] = sensor = FakeSensor(0.05)
+        scan = self.manager.scan_devices_async()
+        connect = self.manager.connect_device_async('fake')
+        disconnect = self.manager.disconnect_async()
+
+        self.release.set()
+        scan.result(5)
+        sensor.come_in_range()
+        disconnect.result(10)
+        self.assertTrue(connect.result(0))
+        self.assertFalse(self.manager.is_connected())
+        self.assertIsNone(self.manager.sensor)
+
+    @unittest.skipUnless(EVENTLET_AVAILABLE, "eventlet not installed")
+    def test_jobs_leave_the_hub_running_under_eventlet(self):
+        """A scan, connect or disconnect that blocks its OS thread doesn't stall green threads"""
+        ok, ticks = run_patched("""
+            from eventlet import patcher
+            from device_manager import BrainBitManager
+            from test_device_manager import start_ticker
+            native_sleep = patcher.original('time').sleep
+            manager = BrainBitManager()
+            manager._scan_devices = lambda timeout_seconds: native_sleep(0.5) or []
+            manager.connect_device = lambda device_id: native_sleep(0.5) or True
+            manager.disconnect = lambda: native_sleep(0.5)
+            ticks = start_ticker()
+            devices = manager.scan_devices_async().result()
+            ok = manager.connect_device_async('fake').result()
+            manager.disconnect_async().result()
+            print('RESULT', devices == [] and ok, ticks[0], file=sys.stderr)
+        """)
+        self.assertEqual(ok, 'True')
+        self.assertGreaterEqual(int(ticks), 15)  # ~30 if the hub kept running
+
+
+class PollingSensor:
+    """Sensor without push callbacks whose reads start failing"""
+
+    def __init__(self):
+        self.fail = False
+
+    def read_signal_data(self):
+        if self.fail:
+            raise RuntimeError("read failed")
+        return []
+
+
+class MockFallbackTest(unittest.TestCase):
+
+    def test_read_error_stops_recording(self):
+        """Mock samples after a failed read never reach the recording"""
+        manager = BrainBitManager()
+        manager.sensor = sensor = PollingSensor()
+        manager._caps = manager._probe_caps(sensor)
+        manager._collect_impl = manager._collect_real
+        recorded, live, errors = [], [], []
+        manager._data_callback = live.append
+        manager._recording_callback = recorded.append
+        manager._recording_error_callback = errors.append
+        self.assertFalse(manager.uses_mock_data())
+
+        sensor.fail = True
+        manager._dispatch_chunk(manager._collect_data_chunk())
+
+        self.assertEqual(recorded, [])
+        self.assertEqual(len(live), 1)
+        self.assertEqual(len(errors), 1)
+        self.assertIn("read failed", errors[0])
+        self.assertTrue(manager.uses_mock_data())
+
+
+if __name__ == '__main__':
+    unittest.main()